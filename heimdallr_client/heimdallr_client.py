@@ -14,30 +14,88 @@ Exit Codes:
 import sys
 
 import logging as log
-from urllib.parse import urlparse, parse_qsl, unquote
-from typing import Optional, Tuple, NoReturn
+from urllib.parse import unquote, unquote_plus
+from typing import Optional, Tuple, NoReturn, Iterator, Iterable
 from pathlib import Path
-from itertools import chain
+from concurrent.futures import ThreadPoolExecutor, Future
+from collections import deque
 
-import platform, os, json, time, traceback, random
+import platform, os, json, time, traceback, random, re
+import atexit, contextlib, functools, hashlib, tempfile
 import subprocess
-
-import grpc
-import heimdallr_grpc.heimdallr_pb2 as heimdallr_pb2
-import heimdallr_grpc.heimdallr_pb2_grpc as heimdallr_pb2_grpc
+import threading
+import mmap
 
 # https://github.com/nlitsme/pyidbutil
 import heimdallr_client.idblib as idblib
 
+# orjson is optional - parses bytes directly in C. Both shims work in bytes so files are opened in binary mode
+try:
+    import orjson
+    json_loads = orjson.loads
+    json_dumps = orjson.dumps
+except ImportError:
+    json_loads = json.loads
+    def json_dumps(obj) -> bytes:
+        return json.dumps(obj).encode("utf-8")
+
+# ijson is optional - allows history files to be streamed instead of loaded in full
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
 # Constants
-idb_exts  = ["idb", "i64"]
+IDB_EXT_TUPLE = (".idb", ".i64")
+# idblib reads a fixed size header - anything smaller can't be an IDB
+IDB_HEADER_SIZE = 0x100
+# Smallest possible endpoint json is "{}"
+MIN_ENDPOINT_SIZE = 2
+# IDA only writes its endpoint once so age alone doesn't mean it is dead - opt in via `endpoint_ttl` in settings
+DEFAULT_ENDPOINT_TTL = None
+# Proposed endpoint naming `{file_hash[:16]}_{pid}.json` - heimdallr_ida does not emit this yet,
+# until it does every endpoint takes the full parse path
+ENDPOINT_PREFIX_LEN = 16
+ENDPOINT_NAME_RE = re.compile(r"[0-9a-f]{%d}_" % ENDPOINT_PREFIX_LEN)
+# Seconds to ignore an endpoint for after it failed to respond
+DEAD_ENDPOINT_COOLDOWN = 30
+# scheme://netloc[/path]?query - path and fragment are ignored
+URI_RE = re.compile(r"^([A-Za-z][A-Za-z0-9+.-]*)://([^/?#]*)[^?#]*(?:\?([^#]*))?")
+QUERY_RE = re.compile(r"([^=&]+)=([^&]*)")
+# Deadline in seconds for GoTo RPCs
+RPC_TIMEOUT = 2.0
+# Seconds to wait for an IDA instance to appear or become responsive
+POLL_LIMIT = 32
+GRPC_CHANNEL_OPTIONS = [
+    ('grpc.keepalive_time_ms', 10000),
+    ('grpc.keepalive_permit_without_calls', 1),
+    # Endpoints are always local
+    ('grpc.enable_http_proxy', 0),
+]
 
 idb_path = None
 ida_location = None
+# Endpoints not modified for this many seconds are treated as dead - None/0 disables (default)
+endpoint_ttl = DEFAULT_ENDPOINT_TTL
 
 # Per Platform Global Paths
 heimdallr_path = None
 idauser_path = None
+
+# Parsed endpoint files keyed by path - (st_mtime_ns, endpoint dict)
+_endpoint_cache : dict[str, Tuple[int, dict]] = {}
+# Endpoints which failed to respond keyed by path - time to ignore them until
+_dead_endpoints : dict[str, float] = {}
+# Parsed history.2.json - (st_mtime_ns, (files, hash -> paths))
+_history_cache = None
+# IDB input hashes keyed by absolute path - [st_mtime_ns, st_size, hash]
+_hash_cache : Optional[dict[str, list]] = None
+_hash_cache_dirty = False
+_hash_cache_lock = threading.Lock()
+# Open search lock file and its path while we hold the search lock
+_lock_fd = None
+_lock_path = None
+
 def alert(title, error):
     if platform.system() == "Windows":
         from ctypes import windll
@@ -78,8 +136,7 @@ def set_global_paths() -> None:
     else:
         idauser_path = Path(os.path.expandvars("$HOME/.idapro/"))
         heimdallr_path = Path(os.path.expandvars("$HOME/.config/heimdallr/"))
-    if not heimdallr_path.exists():
-        heimdallr_path.mkdir(parents = True)
+    heimdallr_path.mkdir(parents = True, exist_ok = True)
 
 
 def load_settings() -> None:
@@ -89,27 +146,33 @@ def load_settings() -> None:
     
     Will exit if settings file does not exist (-1) or invalid (-2)
     """
-    global idb_path, ida_location, heimdallr_path
+    global idb_path, ida_location, heimdallr_path, endpoint_ttl
     
     log.debug(f"IDA Directory: {idauser_path} ({idauser_path.exists()})")
     log.debug(f"Heimdallr Directory: {heimdallr_path} ({heimdallr_path.exists()})")
 
     settings_path = heimdallr_path / "settings.json"
     log.info(f"Loading settings from {settings_path}")
-    if not settings_path.exists():
-        error_message(f"Settings could not be loaded from {settings_path}", -1)    
-    with open(settings_path) as fd:
-        try:
-            settings_dict = json.load(fd)
-        except json.decoder.JSONDecodeError as e:
-            log.exception("JSON Decoder Error!")
-            error_message(f"Malformed settings file: \n{traceback.format_exception_only(e)[-1]}", -2)
-        log.debug(f"Settings: \n{settings_dict}")
+    try:
+        with open(settings_path, "rb") as fd:
+            settings_data = fd.read()
+    except FileNotFoundError:
+        error_message(f"Settings could not be loaded from {settings_path}", -1)
+    try:
+        settings_dict = json_loads(settings_data)
+    except json.decoder.JSONDecodeError as e:
+        log.exception("JSON Decoder Error!")
+        error_message(f"Malformed settings file: \n{traceback.format_exception_only(e)[-1]}", -2)
+    log.debug(f"Settings: \n{settings_dict}")
     try:
         idb_path = settings_dict["idb_path"]
         ida_location = settings_dict["ida_location"]
+        endpoint_ttl = settings_dict.get("endpoint_ttl", DEFAULT_ENDPOINT_TTL)
     except KeyError as e:
         error_message("Malformed settings file - did not contain required keys. Please try reinstalling plugin.", -2)
+    # bool is an int subclass but true/false isn't a meaningful number of seconds
+    if endpoint_ttl is not None and (isinstance(endpoint_ttl, bool) or not isinstance(endpoint_ttl, (int, float))):
+        error_message(f"Malformed settings file - endpoint_ttl must be a number of seconds, got {endpoint_ttl!r}", -2)
        
 def get_history() -> list[str]:
     """Returns the history.json file containing recently opened IDBs. This is generated
@@ -119,36 +182,94 @@ def get_history() -> list[str]:
     
     log.debug(f"History file at {history_path}")
 
-    if not history_path.exists():
+    try:
+        with open(history_path, "rb") as fd:
+            history = json_loads(fd.read())
+    except FileNotFoundError:
         log.warning("History file was not found")
         return None
-
-    with open(history_path) as fd:
-        history = json.load(fd)
     
     log.info(f"History file contains {len(history)} items")
     return history
 
-def get_history_v2() -> Tuple[list[str], dict[str, str]]:
+def get_history_v2() -> Tuple[list[str], dict[str, list[str]]]:
     """Returns the history.2.json file containing recently opened IDBs and hashes. This is generated
-    by the heimdallr_ida plugin on each launch from IDAs internal records."""
-    global idauser_path
+    by the heimdallr_ida plugin on each launch from IDAs internal records.
+    
+    The hash table is returned inverted as hash -> list of IDB paths so lookups don't need to scan it."""
+    global idauser_path, _history_cache
     history_path = idauser_path / "history.2.json"
     
     log.debug(f"History file v2 at {history_path}")
 
-    if not history_path.exists():
+    try:
+        with open(history_path, "rb") as fd:
+            mtime = os.fstat(fd.fileno()).st_mtime_ns
+            if _history_cache and _history_cache[0] == mtime:
+                return _history_cache[1]
+            history = json_loads(fd.read())
+    except FileNotFoundError:
         log.warning("History file was not found")
         return None
-
-    with open(history_path) as fd:
-        history = json.load(fd)
     
     files = history['files']
-    hash_table = history['hash_table']
+    by_hash : dict[str, list[str]] = {}
+    for path, hash in history['hash_table'].items():
+        by_hash.setdefault(hash, []).append(path)
     
     log.info(f"History file contains {len(files)} items")
-    return files, hash_table
+    _history_cache = (mtime, (files, by_hash))
+    return files, by_hash
+
+@contextlib.contextmanager
+def stream_history_v2(file_hash : str) -> Iterator[Optional[Tuple[Iterator[str], Iterator[str]]]]:
+    """Streams the history.2.json file with ijson rather than parsing it all up front. The hash table is
+    read first so a match can return before the file list is parsed. The file is held open for the
+    duration of the `with` block.
+    
+    Args:
+    - file_hash - md5 hash of input file
+    
+    Yields:
+    Optional tuple of lazy iterators over the file list and the paths recorded with `file_hash`.
+    None if ijson is not installed or the history file does not exist."""
+    if ijson is None:
+        yield None
+        return
+    
+    history_path = idauser_path / "history.2.json"
+    log.debug(f"Streaming history file v2 at {history_path}")
+    try:
+        fd = open(history_path, "rb")
+    except FileNotFoundError:
+        log.warning("History file was not found")
+        yield None
+        return
+
+    def hash_matches():
+        fd.seek(0)
+        for path, hash in ijson.kvitems(fd, "hash_table"):
+            if hash == file_hash:
+                yield path
+
+    def files():
+        fd.seek(0)
+        yield from ijson.items(fd, "files.item")
+
+    with fd:
+        yield files(), hash_matches()
+
+def load_endpoint(entry : os.DirEntry) -> dict:
+    """Returns the parsed endpoint json for a directory entry, reusing the cached copy if the file is unmodified"""
+    st = entry.stat()
+    cached = _endpoint_cache.get(entry.path, (None,))
+    if cached[0] == st.st_mtime_ns:
+        return cached[1]
+
+    with open(entry.path, "rb") as fd:
+        endpoint = json_loads(fd.read())
+    _endpoint_cache[entry.path] = (st.st_mtime_ns, endpoint)
+    return endpoint
 
 def find_rpc(db_name : Optional[str], file_hash : str) -> Optional[Tuple[str, Path]]:
     """
@@ -171,6 +292,9 @@ def find_rpc(db_name : Optional[str], file_hash : str) -> Optional[Tuple[str, Pa
     - IDB name
     - IDB Input File MD5 Hash
     
+    Endpoints named `{file_hash[:16]}_{pid}.json` (a proposed convention heimdallr_ida does not use yet) can be
+    skipped unread.
+
     Example JSON:
 
     {"pid": 48762, "address": "127.0.0.1:63227", "file_name": "test.i64", "file_hash": "b058de795064344a4074252e15b9fd39"}
@@ -179,45 +303,123 @@ def find_rpc(db_name : Optional[str], file_hash : str) -> Optional[Tuple[str, Pa
     
     rpc_path = heimdallr_path / "rpc_endpoints"
 
-    if not rpc_path.exists():
+    try:
+        it = os.scandir(rpc_path)
+    except FileNotFoundError:
         log.warning("RPC endpoint path was not found")
         return None
     
-    for endpoint_path in rpc_path.glob('./*'):
-        log.info(endpoint_path)
-        with open(endpoint_path, "r") as fd:
-            endpoint = json.load(fd)
+    seen = set()
+    now = time.time()
+    prefix = f"{file_hash[:ENDPOINT_PREFIX_LEN]}_" if file_hash else None
+    with it:
+        for entry in it:
+            # Skip hidden/partially written files
+            if entry.name.startswith('.'):
+                continue
+            seen.add(entry.path)
+            if _dead_endpoints.get(entry.path, 0) > now:
+                log.debug(f"Skipping unresponsive endpoint {entry.path}")
+                continue
+            # Endpoints named by hash can be rejected without opening them - older names need a full parse
+            if prefix and ENDPOINT_NAME_RE.match(entry.name) and not entry.name.startswith(prefix):
+                continue
+            endpoint_path = Path(entry.path)
+            log.info(endpoint_path)
 
-        log.info(endpoint)
-        # Validate json has something for us to look at
-        if not endpoint or len(endpoint) == 0:
-            continue
-        
-        log.info(db_name)
-        
-        # Validate db name matches the one we're looking for
-        if db_name and endpoint.get("file_name", None) != db_name:
-            continue
-        
-        log.info("hash check")
-        
-        # Validate we're checking input hash and if so, it matches what we're looking for
-        if endpoint.get("file_hash", None) != file_hash:
-            continue
-        
-        # Validate endpoint has address
-        rpc_address = endpoint.get("address", None)
-        if not rpc_address:
-            log.error(f"Malformed RPC information at {endpoint_path}")
-            continue
-        
-        log.info(f"Matching endpoint found for {endpoint.get('file_name')} - {endpoint_path}")
-        return rpc_address, endpoint_path
+            # Cull empty and long dead endpoints before parsing
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                # Removed since the directory was read
+                continue
+            if st.st_size < MIN_ENDPOINT_SIZE:
+                continue
+            if endpoint_ttl and now - st.st_mtime > endpoint_ttl:
+                log.debug(f"Skipping stale endpoint {endpoint_path}")
+                continue
+            try:
+                endpoint = load_endpoint(entry)
+            except FileNotFoundError:
+                continue
+            except ValueError:
+                # Endpoint may still be being written by IDA
+                log.warning(f"Unable to parse RPC information at {endpoint_path}")
+                continue
+
+            log.info(endpoint)
+            # Validate json has something for us to look at
+            if not endpoint or len(endpoint) == 0:
+                continue
+            
+            log.info(db_name)
+            
+            # Validate db name matches the one we're looking for
+            if db_name and endpoint.get("file_name", None) != db_name:
+                continue
+            
+            log.info("hash check")
+            
+            # Validate we're checking input hash and if so, it matches what we're looking for
+            if endpoint.get("file_hash", None) != file_hash:
+                continue
+            
+            # Validate endpoint has address
+            rpc_address = endpoint.get("address", None)
+            if not rpc_address:
+                log.error(f"Malformed RPC information at {endpoint_path}")
+                continue
+            
+            log.info(f"Matching endpoint found for {endpoint.get('file_name')} - {endpoint_path}")
+            return rpc_address, endpoint_path
     
+    # Drop cached endpoints which no longer exist
+    for path in _endpoint_cache.keys() - seen:
+        del _endpoint_cache[path]
+    # Cooldowns are kept until they expire so an endpoint which couldn't be removed is still ignored
+    for path, until in list(_dead_endpoints.items()):
+        if until <= now:
+            del _dead_endpoints[path]
+
     log.info(f"Endpoint not found for idb: {db_name} hash: {file_hash}")
     return None
 
-def poll_rpc(db_name : str, file_hash : str, limit = 32) -> Optional[Tuple[str, Path]]:
+def start_endpoint_watch(rpc_path : Path, changed : threading.Event):
+    """Starts a watchdog observer which sets `changed` whenever an endpoint is created, modified or moved into place.
+
+    Args:
+    - rpc_path - path to rpc_endpoints directory
+    - changed - event to set on directory changes
+
+    Returns:
+    Running observer, or None if watchdog is not installed or the directory does not exist yet
+    """
+    try:
+        from watchdog.observers import Observer
+        from watchdog.events import FileSystemEventHandler
+    except ImportError:
+        log.debug("watchdog not installed - polling for endpoints")
+        return None
+
+    if not rpc_path.exists():
+        return None
+
+    class EndpointHandler(FileSystemEventHandler):
+        def on_created(self, event):
+            changed.set()
+
+        def on_modified(self, event):
+            changed.set()
+
+        def on_moved(self, event):
+            changed.set()
+
+    observer = Observer()
+    observer.schedule(EndpointHandler(), str(rpc_path))
+    observer.start()
+    return observer
+
+def poll_rpc(db_name : str, file_hash : str, limit = POLL_LIMIT) -> Optional[Tuple[str, Path]]:
     """
     Repeatedly searches the rpc_endpoints directory for open IDA instances with a given name and optional MD5 hash for verification.
     Used when waiting for IDA to open a file.
@@ -233,22 +435,92 @@ def poll_rpc(db_name : str, file_hash : str, limit = 32) -> Optional[Tuple[str,
 
     None means timed out
     """
-    # ToDo - Make this a watch style but unsure how to approach cross platform and this shouldn't be too
     backoff = 0.5
     timeout = time.time() + limit
+    rpc_path = heimdallr_path / "rpc_endpoints"
+
+    # Wake on endpoint directory changes where possible, otherwise fall back to polling
+    changed = threading.Event()
+    observer = start_endpoint_watch(rpc_path, changed)
+    # Check once straight away in case the endpoint appeared before the watch started
+    changed.set()
 
-    while (time.time() + backoff) < timeout:
-        log.debug(f"Backoff: {backoff} Limit Time: {timeout}")
-        time.sleep(backoff)
-        result = find_rpc(db_name, file_hash)
-        if result != None:
-            return result
+    try:
+        while (time.time() + (0 if observer else backoff)) < timeout:
+            log.debug(f"Backoff: {backoff} Limit Time: {timeout} Watching: {observer is not None}")
+            if observer:
+                changed.wait(max(timeout - time.time(), 0))
+                changed.clear()
+            else:
+                time.sleep(backoff)
+            result = find_rpc(db_name, file_hash)
+            if result != None:
+                return result
+    finally:
+        if observer:
+            observer.stop()
+            observer.join()
     log.error("Polling for valid gRPC instance failed")
     # Timed out waiting for IDA instance
     return None
 
+def load_hash_cache() -> dict[str, list]:
+    """Returns the `hash_cache.json` contents mapping absolute IDB path to [st_mtime_ns, st_size, input hash].
+    Loaded once per run and written back on exit if modified."""
+    global _hash_cache
+    with _hash_cache_lock:
+        if _hash_cache is not None:
+            return _hash_cache
+        
+        _hash_cache = {}
+        cache_path = heimdallr_path / "hash_cache.json"
+        try:
+            with open(cache_path, "rb") as fd:
+                _hash_cache = json_loads(fd.read())
+        except FileNotFoundError:
+            pass
+        except ValueError:
+            log.warning(f"Hash cache at {cache_path} was malformed - ignoring")
+        atexit.register(save_hash_cache)
+        return _hash_cache
+
+def save_hash_cache() -> None:
+    """Writes the hash cache back to `hash_cache.json` if it has been modified"""
+    if not _hash_cache_dirty:
+        return
+    cache_path = heimdallr_path / "hash_cache.json"
+    tmp_cache_path = None
+    try:
+        with _hash_cache_lock:
+            data = json_dumps(_hash_cache)
+        # Unique temporary file as other clients may be saving at the same time
+        with tempfile.NamedTemporaryFile(dir=heimdallr_path, prefix="hash_cache.", suffix=".tmp", delete=False) as fd:
+            tmp_cache_path = fd.name
+            fd.write(data)
+        os.replace(tmp_cache_path, cache_path)
+    except OSError:
+        log.exception(f"Unable to save hash cache to {cache_path}")
+        if tmp_cache_path and os.path.exists(tmp_cache_path):
+            os.remove(tmp_cache_path)
+
+def hash_db(idb_path : Path) -> Optional[str]:
+    """Returns the hex MD5 hash of an IDBs input file, or None if the file is empty"""
+    # Needs to be bytes mode otherwise unicode messes up decoding
+    with open(idb_path, "rb") as fd:
+        # Can't map an empty file - can't be a valid IDB either
+        if os.fstat(fd.fileno()).st_size == 0:
+            return None
+        # Read through the page cache rather than copying through Python file buffers
+        mm = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            idb = idblib.IDBFile(mm)
+            return idb.get_hash_fast().hex()
+        finally:
+            mm.close()
+
 def verify_db(idb_path : Path, file_hash : str) -> bool:
-    """Verifies an IDBs input file matches a given hash. Expects that the file exists.
+    """Verifies an IDBs input file matches a given hash.
+    Hashes are cached against the IDBs modification time and size. IDBs found to be missing are dropped from the cache.
     
     Args:
     - idb_path - path to IDB
@@ -256,15 +528,30 @@ def verify_db(idb_path : Path, file_hash : str) -> bool:
     
     Returns:
     If the idb input file hash matches the given hash"""
+    global _hash_cache_dirty
     log.debug(f"Validating {idb_path} for input hash {file_hash}")
-    result = False
     
-    # Needs to be bytes mode otherwise unicode messes up decoding
-    with open(idb_path, "r+b") as fd:
-        idb = idblib.IDBFile(fd)
-        idb_hash = idb.get_hash_fast().hex()
-        if idb_hash == file_hash:
-            result = True
+    key = os.path.abspath(idb_path)
+    hash_cache = load_hash_cache()
+    try:
+        st = os.stat(idb_path)
+    except FileNotFoundError:
+        log.debug(f"{idb_path} no longer exists")
+        with _hash_cache_lock:
+            if hash_cache.pop(key, None) is not None:
+                _hash_cache_dirty = True
+        return False
+    cached = hash_cache.get(key)
+    if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+        log.debug(f"Using cached hash for {idb_path}")
+        idb_hash = cached[2]
+    else:
+        idb_hash = hash_db(idb_path)
+        with _hash_cache_lock:
+            hash_cache[key] = [st.st_mtime_ns, st.st_size, idb_hash]
+            _hash_cache_dirty = True
+    
+    result = idb_hash == file_hash
     log.debug(f"Validation result: {result}")
     return result
 
@@ -285,20 +572,38 @@ def search_history(db_name : Optional[str], file_hash : str) -> Optional[Path]:
     Optional path to the matching IDB. None if not found.
     """
     files = None
-    hash_table = None
+    hash_matches = ()
     
-    history = get_history_v2()
-    if not history or len(history) != 2:
-        files = get_history()
-        if not files:
-            return
-
-    files, hash_table = history
+    with stream_history_v2(file_hash) as history:
+        if history is None:
+            history = get_history_v2()
+            if history and len(history) == 2:
+                files, by_hash = history
+                history = files, by_hash.get(file_hash, ())
+        if history and len(history) == 2:
+            files, hash_matches = history
+        else:
+            files = get_history()
+            if not files:
+                return
+        
+        return match_history(db_name, file_hash, files, hash_matches)
 
-    for path, hash in hash_table.items():
-        log.debug(f"Checking {hash} against {file_hash}")
-        if hash != file_hash:
-            continue
+def match_history(db_name : Optional[str], file_hash : str, files : Iterable[str], hash_matches : Iterable[str]) -> Optional[Path]:
+    """Finds the requested IDB in the history, checking the paths recorded with its hash before the file list
+    
+    Args:
+    - db_name - name of database, none if in compatability mode
+    - file_hash - md5 hash of input file
+    - files - recently opened files
+    - hash_matches - paths recorded in the history with `file_hash`
+    
+    Returns:
+    Optional path to the matching IDB. None if not found.
+    """
+    # Only the IDBs recorded with our hash can match
+    for path in hash_matches:
+        log.debug(f"Checking {path} for {file_hash}")
         file_path = Path(path)
         if not file_path.exists():
             continue
@@ -311,7 +616,7 @@ def search_history(db_name : Optional[str], file_hash : str) -> Optional[Path]:
         idb_path = Path(item)
         idb_name = idb_path.name
         
-        if db_name and idb_name[-3:] not in idb_exts:
+        if db_name and not idb_name.endswith(IDB_EXT_TUPLE):
             # Adopt file extension from source URI if not in file
             # Happens when people open file for first time instead of db
             idb_path = add_extension(idb_path, db_name[-4:])
@@ -335,6 +640,26 @@ def search_history(db_name : Optional[str], file_hash : str) -> Optional[Path]:
     log.info(f"IDB not found in history: {db_name} hash: {file_hash}")
     return None
 
+def walk_idbs(root : Path, db_name : Optional[str]) -> Iterator[Path]:
+    """Yields IDBs under a directory in a single walk of the tree
+    
+    Args:
+    - root - directory to search
+    - db_name - name of IDB to match - None to yield all IDBs
+    """
+    # Case insensitive on Windows to match Path.glob
+    match_name = os.path.normcase(db_name) if db_name else None
+    match_exts = tuple(os.path.normcase(ext) for ext in IDB_EXT_TUPLE)
+    for dir_path, _, file_names in os.walk(root):
+        for file_name in file_names:
+            norm_name = os.path.normcase(file_name)
+            if match_name:
+                if norm_name != match_name:
+                    continue
+            elif not norm_name.endswith(match_exts):
+                continue
+            yield Path(dir_path) / file_name
+
 def search_idb_path(db_name : Optional[str], file_hash : str) -> Optional[Path]:
     """Searches IDB Path from settings file for matching IDB. Last resort.
     
@@ -346,27 +671,48 @@ def search_idb_path(db_name : Optional[str], file_hash : str) -> Optional[Path]:
     Optional path to the matching IDB. None if not found.
     """
     global idb_path
-    log.info(f"Searching {len(idb_path)} IDB paths for {db_name}")
 
     if not idb_path:
         log.error("IDB Path not set or empty")
         return None
+    log.info(f"Searching {len(idb_path)} IDB paths for {db_name}")
     
-    idb_path = map(Path, idb_path)
-    for item in idb_path:
-        if not item.exists():
-            log.warning(f"{item} in IDB path did not exist")
-            continue
-        if db_name:
-            glob = item.glob(f"**/{db_name}")
-        else:
-            glob = chain(item.glob(f"**/*.i64"), item.glob(f"**/*.idb"))
-                
-        for potential_idb in glob:
-            if not verify_db(potential_idb, file_hash):
+    # Convert once - later searches in the same process reuse the Paths
+    if not isinstance(idb_path[0], Path):
+        idb_path = tuple(map(Path, idb_path))
+    
+    # Hashing is I/O bound so overlap the reads with the walk. Results are checked in walk order so the
+    # earliest match wins, and we return as soon as everything before it has been ruled out
+    pending : deque[Tuple[Path, Future]] = deque()
+    executor = ThreadPoolExecutor(max_workers=min(8, (os.cpu_count() or 1) * 2))
+    try:
+        for item in idb_path:
+            if not item.exists():
+                log.warning(f"{item} in IDB path did not exist")
                 continue
-            log.info(f"Matching IDB found at {potential_idb} in IDB path")
-            return potential_idb
+            for potential_idb in walk_idbs(item, db_name):
+                # Cheapest rejection first - a stat rather than opening the file
+                if not db_name:
+                    try:
+                        if os.stat(potential_idb).st_size < IDB_HEADER_SIZE:
+                            continue
+                    except OSError:
+                        continue
+                pending.append((potential_idb, executor.submit(verify_db, potential_idb, file_hash)))
+                
+                while pending and pending[0][1].done():
+                    potential_idb, future = pending.popleft()
+                    if future.result():
+                        log.info(f"Matching IDB found at {potential_idb} in IDB path")
+                        return potential_idb
+        
+        while pending:
+            potential_idb, future = pending.popleft()
+            if future.result():
+                log.info(f"Matching IDB found at {potential_idb} in IDB path")
+                return potential_idb
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
     
     log.info(f"IDB not found in IDB Path: {db_name} hash: {file_hash}")
     return None
@@ -422,152 +768,172 @@ def launch_ida(idb_name : str, file_hash : str) -> None:
     
     log.info(f"IDA opened for {path}")
 
-def not_exist_wait(path : Path, max_wait : Optional[int] = None) -> None:
-    """Returns once a file no longer exists
-    Used to lock access to files
+def lock_file(fd, max_wait : float) -> bool:
+    """Takes an exclusive OS level lock on an open file, retrying until it is available
     
     Args:
-    - path - path to file
-    - max_wait - maximum time to wait for file to exist
+    - fd - open file to lock
+    - max_wait - maximum time to wait for the lock in seconds
 
-    Raises:
-    TimeoutError if max_timeout is met
-    
+    Returns:
+    If the lock was taken before `max_wait` ran out
     """
-    timeout = None
-    if max_wait != None:
-        timeout = time.time() + max_wait
-    
-    while path.exists():
-        time.sleep(0.5)
-        if max_wait and time.time() > timeout:
-            raise TimeoutError("Ran out of time waiting for search lock")
+    timeout = time.time() + max_wait
+    while True:
+        try:
+            if platform.system() == "Windows":
+                import msvcrt
+                # Locks the first byte
+                fd.seek(0)
+                msvcrt.locking(fd.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(fd.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            if time.time() > timeout:
+                return False
+            time.sleep(0.1)
+
+def unlock_file(fd) -> None:
+    """Releases a lock taken with `lock_file`"""
+    if platform.system() == "Windows":
+        import msvcrt
+        fd.seek(0)
+        msvcrt.locking(fd.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(fd.fileno(), fcntl.LOCK_UN)
 
 def lock_search(idb_name : str, file_hash : str):
-    """Adds an entry to `search.lock` which stops mutliple searches being executed at the same time.
-    For example accidental double/triple clicks.
+    """Takes an exclusive lock for this database in `search_locks` which stops mutliple searches for the same
+    database being executed at the same time. For example accidental double/triple clicks.
+    Searches for other databases use a different lock file so aren't held up.
+
+    The lock file contains the current holders pid and search as json, and is removed again on release.
 
     Args:
     - idb_name - name of idb being searched for
     - file_hash - hash of idb being searched for
+
+    Raises:
+    RuntimeError if the lock is still held by another search after 10 seconds
     """
-    lock_path : Path = heimdallr_path / "search.lock"
-    tmp_lock_path : Path = heimdallr_path / "search.lock.tmp"
+    global _lock_fd, _lock_path
+    lock_dir : Path = heimdallr_path / "search_locks"
+    lock_dir.mkdir(exist_ok = True)
+    lock_name = hashlib.md5(f"{idb_name}:{file_hash}".encode("utf-8")).hexdigest()
+    lock_path : Path = lock_dir / f"{lock_name}.lock"
+
+    timeout = time.time() + 10
+    while True:
+        fd = os.fdopen(os.open(lock_path, os.O_RDWR | os.O_CREAT), "r+b")
+        if not lock_file(fd, max_wait = max(timeout - time.time(), 0)):
+            fd.close()
+            raise RuntimeError(f"Search lock already taken at {lock_path} - search already in progress?")
+        # The previous holder may have removed the file after we opened it - only keep the lock if it's still the live file
+        try:
+            if os.fstat(fd.fileno()).st_ino == os.stat(lock_path).st_ino:
+                break
+        except FileNotFoundError:
+            pass
+        unlock_file(fd)
+        fd.close()
 
     try:
-        not_exist_wait(tmp_lock_path, max_wait = 10)
-        if tmp_lock_path.exists():
-            raise RuntimeError(f"Search lock already taken at {tmp_lock_path} - search already in progress?")
-        
-        tmp_lock_path.touch()
-        locks = {}
-        if lock_path.exists():
-            with open(lock_path, "r") as fd:
-                locks = json.load(fd)
-        
-        locks[os.getpid()] = (idb_name, file_hash)
-        with open(tmp_lock_path, "w") as fd:
-            json.dump(locks, fd)
-            fd.flush()
-            os.fsync(fd.fileno())
-        
-        os.replace(tmp_lock_path, lock_path)
+        # orjson only allows str keys
+        locks = {f'{os.getpid()}': (idb_name, file_hash)}
+        fd.seek(0)
+        fd.truncate()
+        fd.write(json_dumps(locks))
+        # Lock state doesn't need to survive a crash so no fsync
+        fd.flush()
     except Exception:
-        if tmp_lock_path.exists():
-            os.remove(tmp_lock_path)
+        fd.close()
         raise
+    _lock_fd = fd
+    _lock_path = lock_path
 
 def release_lock():
-    """Remove current process entry from `search.lock`
-
-    Args:
-    - idb_name - name of idb being searched for
-    - file_hash - hash of idb being searched for
-    """
-    lock_path : Path = heimdallr_path / "search.lock"
-    tmp_lock_path : Path = heimdallr_path / "search.lock.tmp"
-
+    """Removes the search lock file and releases the lock"""
+    global _lock_fd, _lock_path
+    if _lock_fd is None:
+        return
+    
+    fd, _lock_fd = _lock_fd, None
+    lock_path, _lock_path = _lock_path, None
     try:
-        not_exist_wait(tmp_lock_path, max_wait = 10)
-        if tmp_lock_path.exists():
-            raise RuntimeError(f"Search lock already taken at {tmp_lock_path} - search already in progress?")
-        
-        tmp_lock_path.touch()
-        locks = {}
-        if lock_path.exists():
-            with open(lock_path, "r") as fd:
-                locks = json.load(fd)
-                
-        pid_str = f'{os.getpid()}' 
-        if pid_str in locks:
-            locks.pop(pid_str) 
-        
-        with open(tmp_lock_path, "w") as fd:
-            json.dump(locks, fd)
-            fd.flush()
-            os.fsync(fd.fileno())
-        
-        os.replace(tmp_lock_path, lock_path)
-    except Exception:
-        if tmp_lock_path.exists():
-            os.remove(tmp_lock_path)
-        raise
+        fd.seek(0)
+        fd.truncate()
+        fd.flush()
+        # POSIX - remove while still holding the lock, waiters notice the inode change and retry
+        if platform.system() != "Windows":
+            os.remove(lock_path)
+        unlock_file(fd)
+    finally:
+        fd.close()
+    
+    # Windows - open files can't be removed, this only succeeds if no other search has the file open
+    if platform.system() == "Windows":
+        try:
+            os.remove(lock_path)
+        except OSError:
+            pass
 
-def check_lock(idb_name : str, file_hash : str) -> bool:
-    """Chceks `search.lock` for an existing lock on our file
 
-    Args:
-    - idb_name - name of idb being searched for
-    - file_hash - hash of idb being searched for
+@functools.lru_cache(maxsize=None)
+def load_grpc():
+    """Imports gRPC and the heimdallr protobufs. Deferred until an RPC is made so failures before then exit quickly
+    
+    Returns:
+    Tuple of grpc, heimdallr_pb2 and heimdallr_pb2_grpc modules
     """
-    lock_path : Path = heimdallr_path / "search.lock"
-    with open(lock_path, "r") as fd:
-        locks : dict[str, Tuple[str, str]] = json.load(fd)
-    our_pid = f'{os.getpid()}'
-    if our_pid not in locks:
-        raise RuntimeError("Search lock not taken before lock check")
-    
-    found = False
-    for pid, (name, hash) in locks.items():
-        if name != idb_name or hash != file_hash:
-            continue
-        found = True
-        if pid != our_pid and our_pid > pid:
-            return False
-    return True
-
-
+    import grpc
+    import heimdallr_grpc.heimdallr_pb2 as heimdallr_pb2
+    import heimdallr_grpc.heimdallr_pb2_grpc as heimdallr_pb2_grpc
+    return grpc, heimdallr_pb2, heimdallr_pb2_grpc
 
 def run(url):
     db_name = None
     file_hash = None
     locked = False
+    channel = None
+    channel_endpoint = None
     try:
-        url = unquote(url)
         log.info(f"Trying to resolve URI: {url}")
         
-        parsed_url = urlparse(url)
+        # Escaped URIs are unquoted in full before matching as any separator may be escaped.
+        # Without escapes unquote is a no-op so it is skipped
+        if "%" in url:
+            url = unquote(url)
+        parsed_url = URI_RE.match(url)
         log.debug(f"URL Parse result:\n{parsed_url}")
 
         if not parsed_url:
             error_message(f"Unable to parse url {url}", -4)
 
-        if parsed_url.scheme != "ida" and parsed_url.scheme != "disas":
-            error_message(f"Unexpected URL scheme {parsed_url.scheme}", -4)
+        scheme, netloc, raw_query = parsed_url.groups()
+        scheme = scheme.lower()
+
+        if scheme != "ida" and scheme != "disas":
+            error_message(f"Unexpected URL scheme {scheme}", -4)
         
-        if not parsed_url.query:
+        if not raw_query:
             error_message("URL did not have any query info", -4)
         
-        query = dict(parse_qsl(parsed_url.query))
+        # Matches parse_qsl - blank values are dropped
+        query = {unquote_plus(key): unquote_plus(value) for key, value in QUERY_RE.findall(raw_query) if value}
+        if "offset" not in query:
+            error_message("URL did not have an offset", -4)
         
         db_name = None
         file_hash = None
         
-        if parsed_url.scheme == "disas":
+        if scheme == "disas":
             db_name = query.get("idb", None)
-            file_hash = parsed_url.netloc
+            file_hash = netloc
         else:
-            db_name = parsed_url.netloc
+            db_name = netloc
             file_hash = query.get("hash", None)
         
         
@@ -575,10 +941,10 @@ def run(url):
         
         locked = True
         lock_search(db_name, file_hash)
-        if not check_lock(db_name, file_hash):
-            raise RuntimeError("Can only have request for single database at a time!")
 
         finished = False
+        # Slow responses are retried until this time
+        retry_until = time.time() + POLL_LIMIT
         # Loop a few times incase there is a dead endpoint in our directory from a crashed IDA instance
         while not finished:
 
@@ -588,41 +954,61 @@ def run(url):
                 # Couldn't find a currently open IDA istance
                 launch_ida(db_name, file_hash)
                 
+                retry_until = time.time() + POLL_LIMIT
                 result = poll_rpc(db_name, file_hash)
                 if not result:
                     error_message(f"Could not find IDA instance when opening {idb_name}", -6)
                 # Placebo sleep just to make sure IDA is going to be receptive to GUI manipulation            
             
-            try:
-                endpoint, path = result
+            endpoint, path = result
+            grpc, heimdallr_pb2, heimdallr_pb2_grpc = load_grpc()
+            # Only reconnect when the endpoint has changed
+            if channel_endpoint != endpoint:
+                if channel is not None:
+                    channel.close()
                 log.info(f"Connecting to {endpoint}")
+                channel = grpc.insecure_channel(endpoint, options=GRPC_CHANNEL_OPTIONS)
+                channel_endpoint = endpoint
+                stub = heimdallr_pb2_grpc.idaRPCStub(channel)
 
-                with grpc.insecure_channel(endpoint) as channel:
-                    stub = heimdallr_pb2_grpc.idaRPCStub(channel)
-                    # ToDo: Recreate selection in view
-                    request = heimdallr_pb2.GoToRequest(address=query['offset'], size="0x00")
-                    response : heimdallr_pb2.ResponseCode = None
-                    view = query.get("view")
-                    if view == "disasm":
-                        response = stub.disasmGoTo(request)
-                    elif view == "pseudo":
-                        response = stub.pseudoGoTo(request)
-                    else:
-                        response = stub.genericGoTo(request)
-                    log.info(f"RPC Response {response}")
-                    finished = True
+            try:
+                # ToDo: Recreate selection in view
+                request = heimdallr_pb2.GoToRequest(address=query['offset'], size="0x00")
+                response : heimdallr_pb2.ResponseCode = None
+                view = query.get("view")
+                if view == "disasm":
+                    response = stub.disasmGoTo(request, timeout=RPC_TIMEOUT)
+                elif view == "pseudo":
+                    response = stub.pseudoGoTo(request, timeout=RPC_TIMEOUT)
+                else:
+                    response = stub.genericGoTo(request, timeout=RPC_TIMEOUT)
+                log.info(f"RPC Response {response}")
+                finished = True
             except grpc.RpcError as rpc_error:
                 # Clears stale connection records
                 # ToDo: Make this less aggressive - i.e. 3 attempts before a record is removed
                 if rpc_error.code() == grpc.StatusCode.UNAVAILABLE:
                     log.error(f"{endpoint} not responding - deleting record")
-                    path.unlink()
+                    # Channel may be stuck in TRANSIENT_FAILURE - don't reuse it for a new endpoint at the same address
+                    channel.close()
+                    channel = None
+                    channel_endpoint = None
+                    _dead_endpoints[str(path)] = time.time() + DEAD_ENDPOINT_COOLDOWN
+                    try:
+                        path.unlink(missing_ok = True)
+                    except OSError:
+                        log.warning(f"Unable to delete {path} - ignoring it for {DEAD_ENDPOINT_COOLDOWN}s")
+                elif rpc_error.code() == grpc.StatusCode.DEADLINE_EXCEEDED and time.time() < retry_until:
+                    # IDA is likely still loading the database - keep the endpoint and try again
+                    log.warning(f"{endpoint} timed out - retrying")
                 else:
                     log.exception("Unhandled RPC exception!")
                     error_message(f"IDA connection error: {traceback.format_exception_only(rpc_error)[-1]}", -2)
 
         log.debug(f"RPC client received: {response.Response}" )
     finally:
+        if channel is not None:
+            channel.close()
         if locked:
             release_lock()
 